@@ -1,4 +1,7 @@
-import csv, re, sys, io, requests, os
+import csv, re, sys, io, requests, os, json, hashlib, mmap, itertools, threading, time, math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from email.utils import parsedate_to_datetime
 from typing import List, Tuple, Optional
 try:
     from PIL import Image
@@ -21,11 +24,34 @@ try:
 except ImportError:
     pytesseract = None
 
+# Vectorized threshold sweep (optional)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Parquet/Arrow (optional)
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Rozdzielczość analizy kolorów tabelki z blokami
+TABLE_SIZE = (200, 50)
+
+
+def crop_table(img: Image.Image) -> Image.Image:
+    """Wycina dolną tabelkę z blokami (pełna rozdzielczość)."""
+    w, h = img.size
+    return img.crop((0, int(h * 0.65), w, h))
+
 
 def parse_block_table(img: Image.Image) -> dict:
     """Parsuje dolną tabelkę na obrazie - wyciąga listę bloków (ikony + liczby)."""
-    w, h = img.size
-    table_region = img.crop((0, int(h * 0.65), w, h))
+    table_region = crop_table(img)
     
     blocks_found = {}
     
@@ -40,9 +66,14 @@ def parse_block_table(img: Image.Image) -> dict:
             pass
     
     # Analiza kolorów ikon bloków
-    small_table = table_region.resize((200, 50))
-    pixels = list(small_table.getdata())
-    
+    small_table = table_region.convert("RGB").resize(TABLE_SIZE)
+    blocks_found.update(parse_block_table_pixels(list(small_table.getdata())))
+    return blocks_found
+
+
+def parse_block_table_pixels(pixels: list) -> dict:
+    """Zlicza kolory ikon bloków w pikselach tabelki (RGB, rozmiar ``TABLE_SIZE``)."""
+    blocks_found = {}
     color_counts = {}
     for p in pixels:
         if p[0] > 220 and p[1] > 200 and p[2] < 180:  # beżowe tło tabelki
@@ -67,17 +98,53 @@ def parse_block_table(img: Image.Image) -> dict:
     return blocks_found
 
 
-def analyze_built_structure(img: Image.Image) -> dict:
-    """Analizuje CO KONKRETNIE jest zbudowane na obrazie - rozpoznaje kształty i struktury."""
+# Progi detektorów struktury (wynik > próg => cecha wykryta)
+STRUCTURE_THRESHOLDS = {
+    'house': 0.3,
+    'tower': 0.4,
+    'bridge': 0.3,
+    'farm': 0.25,
+    'mine': 0.3,
+    'waterfall': 0.4,
+    'forest': 0.3,
+    'lake': 0.25,
+    'mountains': 0.3,
+}
+
+# Rozdzielczość analizy sceny: pełna i zgrubna (tryb progresywny)
+SCENE_SIZE = (150, 100)
+COARSE_SCENE_SIZE = (38, 25)
+
+# Wynik zgrubny jest akceptowany, gdy jest co najmniej tak daleko od każdego progu nazwy
+PROGRESSIVE_MARGIN = 0.15
+
+# Detektory, których wynik jest proporcją pikseli, a więc nie zależy od rozdzielczości.
+# Tylko one mogą być rozstrzygnięte na zgrubnej miniaturze - pozostałe sumują stały
+# wkład za każde trafienie lub szukają lokalnych wzorów i zawsze liczą się w SCENE_SIZE.
+COARSE_DETECTORS = ('lake',)
+
+# Statystyki trybu progresywnego: liczby decyzji zgrubnych i eskalacji na detektor
+progressive_stats = {
+    'images': 0,
+    'full_matrix': 0,
+    'coarse': {detector: 0 for detector in COARSE_DETECTORS},
+    'escalated': {detector: 0 for detector in COARSE_DETECTORS},
+    'audited': 0,
+    'agreed': 0,
+}
+
+
+def crop_scene(img: Image.Image) -> Image.Image:
+    """Wycina scenę 3D (bez tabelki z blokami) w RGB."""
     w, h = img.size
     scene = img.crop((int(w*0.08), int(h*0.05), int(w*0.92), int(h*0.62)))
-    
-    # Większa rozdzielczość dla lepszego rozpoznawania kształtów
-    analysis_img = scene.convert("RGB").resize((150, 100))
-    pixels = list(analysis_img.getdata())
-    
-    # Konwertuj na macierz 2D dla analizy kształtów
-    sw, sh = analysis_img.size
+    return scene.convert("RGB")
+
+
+def to_pixel_matrix(img: Image.Image) -> list:
+    """Konwertuje obraz RGB na macierz 2D pikseli dla analizy kształtów."""
+    pixels = list(img.getdata())
+    sw, sh = img.size
     pixel_matrix = []
     for y in range(sh):
         row = []
@@ -85,67 +152,163 @@ def analyze_built_structure(img: Image.Image) -> dict:
             p = pixels[y * sw + x]
             row.append(p)
         pixel_matrix.append(row)
-    
+    return pixel_matrix
+
+
+def score_structure(pixel_matrix: list, detectors: Optional[List[str]] = None) -> dict:
+    """Liczy surowe wyniki detektorów struktur (0.0-1.0) - wszystkich lub wybranych."""
+    all_detectors = {
+        'house': detect_house_shape,
+        'tower': detect_tower_shape,
+        'bridge': detect_bridge_shape,
+        'farm': detect_farm_pattern,
+        'mine': detect_mine_structure,
+        'waterfall': detect_waterfall,
+        'forest': detect_forest_pattern,
+        'lake': detect_lake_shape,
+        'mountains': detect_mountain_layers,
+    }
+    if detectors is None:
+        detectors = list(all_detectors)
+    return {name: all_detectors[name](pixel_matrix) for name in detectors}
+
+
+def structure_from_scores(scores: dict) -> dict:
+    """Zamienia surowe wyniki detektorów na opis struktury według progów."""
+    t = STRUCTURE_THRESHOLDS
     structure = {}
     
     # === WYKRYWANIE KONKRETNYCH BUDOWLI ===
     
-    # Wykryj DOM/CHATĘ - prostokątne struktury z dachem
-    house_score = detect_house_shape(pixel_matrix)
-    if house_score > 0.3:
+    # DOM/CHATA - prostokątne struktury z dachem
+    if scores['house'] > t['house']:
         structure['building_type'] = 'house'
-        structure['house_complexity'] = house_score
+        structure['house_complexity'] = scores['house']
     
-    # Wykryj ZAMEK/WIEŻĘ - wysokie pionowe struktury
-    tower_score = detect_tower_shape(pixel_matrix)
-    if tower_score > 0.4:
+    # ZAMEK/WIEŻA - wysokie pionowe struktury
+    if scores['tower'] > t['tower']:
         structure['building_type'] = 'tower'
-        structure['tower_height'] = tower_score
+        structure['tower_height'] = scores['tower']
     
-    # Wykryj MOST - poziome struktury nad wodą/przepaścią
-    bridge_score = detect_bridge_shape(pixel_matrix)
-    if bridge_score > 0.3:
+    # MOST - poziome struktury nad wodą/przepaścią
+    if scores['bridge'] > t['bridge']:
         structure['has_bridge'] = True
-        structure['bridge_length'] = bridge_score
+        structure['bridge_length'] = scores['bridge']
     
-    # Wykryj FARMĘ - regularne pola z roślinami
-    farm_score = detect_farm_pattern(pixel_matrix)
-    if farm_score > 0.25:
+    # FARMA - regularne pola z roślinami
+    if scores['farm'] > t['farm']:
         structure['has_farm'] = True
-        structure['farm_size'] = farm_score
+        structure['farm_size'] = scores['farm']
     
-    # Wykryj KOPALNIĘ - pionowe szyby/tunele
-    mine_score = detect_mine_structure(pixel_matrix)
-    if mine_score > 0.3:
+    # KOPALNIA - pionowe szyby/tunele
+    if scores['mine'] > t['mine']:
         structure['has_mine'] = True
-        structure['mine_depth'] = mine_score
+        structure['mine_depth'] = scores['mine']
     
-    # Wykryj WODOSPAD - pionowy przepływ wody
-    waterfall_score = detect_waterfall(pixel_matrix)
-    if waterfall_score > 0.4:
+    # WODOSPAD - pionowy przepływ wody
+    if scores['waterfall'] > t['waterfall']:
         structure['has_waterfall'] = True
-        structure['waterfall_height'] = waterfall_score
+        structure['waterfall_height'] = scores['waterfall']
     
-    # Wykryj LAS/DRZEWA - skupiska zieleni z "koronami"
-    forest_score = detect_forest_pattern(pixel_matrix)
-    if forest_score > 0.3:
+    # LAS/DRZEWA - skupiska zieleni z "koronami"
+    if scores['forest'] > t['forest']:
         structure['has_forest'] = True
-        structure['forest_density'] = forest_score
+        structure['forest_density'] = scores['forest']
     
-    # Wykryj JEZIORO - duże skupisko niebieskiego
-    lake_score = detect_lake_shape(pixel_matrix)
-    if lake_score > 0.25:
+    # JEZIORO - duże skupisko niebieskiego
+    if scores['lake'] > t['lake']:
         structure['has_lake'] = True
-        structure['lake_size'] = lake_score
+        structure['lake_size'] = scores['lake']
     
-    # Wykryj GÓRY/WZGÓRZA - warstwy o różnych wysokościach
-    mountain_score = detect_mountain_layers(pixel_matrix)
-    if mountain_score > 0.3:
+    # GÓRY/WZGÓRZA - warstwy o różnych wysokościach
+    if scores['mountains'] > t['mountains']:
         structure['has_mountains'] = True
-        structure['mountain_height'] = mountain_score
+        structure['mountain_height'] = scores['mountains']
     
     return structure
 
+
+def decision_thresholds() -> dict:
+    """Wszystkie progi, przy których zmienia się nazwa: wykrycie i siła nazwy (detektor -> progi)."""
+    thresholds = {detector: [threshold] for detector, threshold in STRUCTURE_THRESHOLDS.items()}
+    for detector, levels, _ in NAME_RULES:
+        thresholds[detector].extend(NAME_THRESHOLDS[key] for key, _ in levels)
+    return thresholds
+
+
+def progressive_scene_scores(scene: Image.Image, audit: bool = False) -> dict:
+    """Rozstrzyga detektory z ``COARSE_DETECTORS`` na zgrubnej miniaturze, resztę w pełnej rozdzielczości.
+    
+    Wynik zgrubny jest przyjmowany tylko, gdy leży co najmniej
+    ``PROGRESSIVE_MARGIN`` od każdego progu wykrycia i siły nazwy; w przeciwnym
+    razie detektor jest liczony w pełnej rozdzielczości (eskalacja). Macierz
+    pikseli ``SCENE_SIZE`` jest budowana tylko, gdy jakiś detektor jej wymaga.
+    Przy ``audit`` przyjęte wyniki zgrubne są porównywane z pełną
+    rozdzielczością na poziomie nazw bazowych (do raportu).
+    """
+    full_img = scene.resize(SCENE_SIZE)
+    coarse = score_structure(to_pixel_matrix(full_img.resize(COARSE_SCENE_SIZE)), COARSE_DETECTORS)
+    thresholds = decision_thresholds()
+    settled = {detector: score for detector, score in coarse.items()
+               if all(abs(score - t) >= PROGRESSIVE_MARGIN for t in thresholds[detector])}
+    
+    stats = progressive_stats
+    stats['images'] += 1
+    for detector in COARSE_DETECTORS:
+        stats['coarse' if detector in settled else 'escalated'][detector] += 1
+    
+    remaining = [d for d in STRUCTURE_THRESHOLDS if d not in settled]
+    full_matrix = None
+    if remaining or (audit and settled):
+        full_matrix = to_pixel_matrix(full_img)
+        stats['full_matrix'] += 1
+    scores = score_structure(full_matrix, remaining) if remaining else {}
+    scores.update(settled)
+    
+    if audit and settled:
+        full = dict(scores, **score_structure(full_matrix, list(settled)))
+        stats['audited'] += 1
+        if (determine_base_name(structure_from_scores(scores), {}) ==
+                determine_base_name(structure_from_scores(full), {})):
+            stats['agreed'] += 1
+    return scores
+
+
+def print_progressive_report():
+    """Wypisuje decyzje zgrubne i eskalacje dla każdego detektora z ``COARSE_DETECTORS``."""
+    stats = progressive_stats
+    total = stats['images']
+    if not total:
+        return
+    print(f"\nTryb progresywny: {total} obrazów, macierz {SCENE_SIZE[0]}x{SCENE_SIZE[1]} "
+          f"zbudowana dla {stats['full_matrix']}/{total}")
+    for detector in COARSE_DETECTORS:
+        escalated = stats['escalated'][detector]
+        print(f"  {detector}: zgrubnie {stats['coarse'][detector]}, eskalacje {escalated}/{total} "
+              f"({100.0 * escalated / total:.1f}%)")
+    always_full = [d for d in STRUCTURE_THRESHOLDS if d not in COARSE_DETECTORS]
+    if always_full:
+        print(f"  Zawsze w pełnej rozdzielczości: {', '.join(always_full)}")
+    if stats['audited']:
+        print(f"Zgodność zgrubnych wyników z pełną rozdzielczością: "
+              f"{stats['agreed']}/{stats['audited']} "
+              f"({100.0 * stats['agreed'] / stats['audited']:.1f}%)")
+
+
+def scene_scores(img: Image.Image, progressive: bool = False, audit: bool = False) -> dict:
+    """Surowe wyniki detektorów dla sceny obrazu (opcjonalnie progresywnie)."""
+    scene = crop_scene(img)
+    if progressive:
+        return progressive_scene_scores(scene, audit)
+    
+    # Większa rozdzielczość dla lepszego rozpoznawania kształtów
+    return score_structure(to_pixel_matrix(scene.resize(SCENE_SIZE)))
+
+
+def analyze_built_structure(img: Image.Image, progressive: bool = False, audit: bool = False) -> dict:
+    """Analizuje CO KONKRETNIE jest zbudowane na obrazie - rozpoznaje kształty i struktury."""
+    return structure_from_scores(scene_scores(img, progressive, audit))
+
 def detect_house_shape(matrix):
     """Wykrywa kształt domu - prostokąty z trójkątnym dachem."""
     h, w = len(matrix), len(matrix[0])
@@ -416,93 +579,67 @@ def generate_unique_name_from_structure(structure: dict, blocks_info: dict, orig
     
     return unique_name
 
+# Progi wyboru nazwy w obrębie wykrytej struktury (wynik > próg => mocniejsza nazwa)
+NAME_THRESHOLDS = {
+    'house_large': 0.7,
+    'house_family': 0.5,
+    'tower_watch': 0.8,
+    'tower_defense': 0.6,
+    'bridge_large': 0.7,
+    'farm_large': 0.6,
+    'mine_deep': 0.6,
+    'waterfall_large': 0.7,
+    'forest_dense': 0.6,
+    'lake_large': 0.5,
+    'mountains_high': 0.6,
+}
+
+# Reguły nazw bazowych w kolejności priorytetu:
+# (detektor, [(próg z NAME_THRESHOLDS, nazwa), ...], nazwa domyślna struktury)
+NAME_RULES = [
+    ('tower', [('tower_watch', "Strażnicza Wieża"), ('tower_defense', "Obronna Wieża")], "Kamienna Wieża"),
+    ('house', [('house_large', "Wielka Rezydencja"), ('house_family', "Rodzinny Dom")], "Przytulna Chatka"),
+    ('bridge', [('bridge_large', "Wielki Most")], "Kamiennym Most"),
+    ('farm', [('farm_large', "Rozległa Farma")], "Rolnicza Osada"),
+    ('mine', [('mine_deep', "Głęboka Kopalnia")], "Górnicza Szybka"),
+    ('waterfall', [('waterfall_large', "Majestatyczny Wodospad")], "Leśny Wodospad"),
+    ('forest', [('forest_dense', "Gęsty Las")], "Zielony Gaj"),
+    ('lake', [('lake_large', "Błękitne Jezioro")], "Górski Staw"),
+    ('mountains', [('mountains_high', "Wysokie Szczyty")], "Skaliste Wzgórza"),
+]
+FALLBACK_BASE_NAME = "Kreatywna Budowa"
+
+# Klucz wartości wyniku detektora w opisie struktury
+STRUCTURE_VALUE_KEYS = {
+    'house': 'house_complexity',
+    'tower': 'tower_height',
+    'bridge': 'bridge_length',
+    'farm': 'farm_size',
+    'mine': 'mine_depth',
+    'waterfall': 'waterfall_height',
+    'forest': 'forest_density',
+    'lake': 'lake_size',
+    'mountains': 'mountain_height',
+}
+
+def structure_has(structure: dict, detector: str) -> bool:
+    """Czy opis struktury zawiera cechę wykrytą przez dany detektor."""
+    if detector in ('house', 'tower'):
+        return structure.get('building_type') == detector
+    return bool(structure.get(f'has_{detector}'))
+
 def determine_base_name(structure: dict, blocks_info: dict) -> str:
-    """Określa podstawową nazwę na podstawie wykrytej struktury."""
-    
-    # === KONKRETNE BUDOWLE ===
-    building_type = structure.get('building_type', '')
-    
-    if building_type == 'house':
-        complexity = structure.get('house_complexity', 0)
-        if complexity > 0.7:
-            return "Wielka Rezydencja"
-        elif complexity > 0.5:
-            return "Rodzinny Dom"
-        else:
-            return "Przytulna Chatka"
-    
-    elif building_type == 'tower':
-        height = structure.get('tower_height', 0)
-        if height > 0.8:
-            return "Strażnicza Wieża"
-        elif height > 0.6:
-            return "Obronna Wieża"
-        else:
-            return "Kamienna Wieża"
-    
-    # === SPECJALISTYCZNE KONSTRUKCJE ===
-    if structure.get('has_bridge'):
-        length = structure.get('bridge_length', 0)
-        if length > 0.7:
-            return "Wielki Most"
-        else:
-            return "Kamiennym Most"
-    
-    if structure.get('has_farm'):
-        size = structure.get('farm_size', 0)
-        if size > 0.6:
-            return "Rozległa Farma"
-        else:
-            return "Rolnicza Osada"
-    
-    if structure.get('has_mine'):
-        depth = structure.get('mine_depth', 0)
-        if depth > 0.6:
-            return "Głęboka Kopalnia"
-        else:
-            return "Górnicza Szybka"
-    
-    if structure.get('has_waterfall'):
-        height = structure.get('waterfall_height', 0)
-        if height > 0.7:
-            return "Majestatyczny Wodospad"
-        else:
-            return "Leśny Wodospad"
-    
-    # === NATURALNE KRAJOBRAZY ===
-    if structure.get('has_forest'):
-        density = structure.get('forest_density', 0)
-        if density > 0.6:
-            return "Gęsty Las"
-        else:
-            return "Zielony Gaj"
-    
-    if structure.get('has_lake'):
-        size = structure.get('lake_size', 0)
-        if size > 0.5:
-            return "Błękitne Jezioro"
-        else:
-            return "Górski Staw"
-    
-    if structure.get('has_mountains'):
-        height = structure.get('mountain_height', 0)
-        if height > 0.6:
-            return "Wysokie Szczyty"
-        else:
-            return "Skaliste Wzgórza"
-    
-    # === KOMBINACJE ===
-    if structure.get('has_waterfall') and structure.get('has_forest'):
-        return "Leśna Dolina"
-    
-    if structure.get('building_type') and structure.get('has_forest'):
-        return "Leśna Osada"
-    
-    if structure.get('has_lake') and structure.get('has_mountains'):
-        return "Alpejska Kraina"
+    """Określa podstawową nazwę na podstawie wykrytej struktury (według ``NAME_RULES``)."""
+    for detector, levels, default_name in NAME_RULES:
+        if not structure_has(structure, detector):
+            continue
+        value = structure.get(STRUCTURE_VALUE_KEYS[detector], 0)
+        for key, name in levels:
+            if value > NAME_THRESHOLDS[key]:
+                return name
+        return default_name
     
-    # === FALLBACK ===
-    return "Kreatywna Budowa"
+    return FALLBACK_BASE_NAME
 
 def create_themed_variant(base_name: str, sku: str) -> str:
     """Tworzy wariant tematyczny na podstawie SKU."""
@@ -565,14 +702,20 @@ def create_numbered_variant(base_name: str, variant_num: int) -> str:
         return f"{base_name} nr {variant_num}"
 
 
-def classify_scene_top_k(img: Image.Image, k: int = 3, original_sku: str = "") -> List[Tuple[str, float]]:
+def classify_scene_top_k(img: Image.Image, k: int = 3, original_sku: str = "",
+                         progressive: bool = False, audit: bool = False) -> List[Tuple[str, float]]:
     """Generuje unikalne nazwy na podstawie rzeczywistej analizy sceny."""
     # 1. Parsuj tabelkę (pomocniczo)
     blocks_info = parse_block_table(img)
     
     # 2. DOKŁADNA analiza sceny - rozpoznaj kształty i struktury
-    structure = analyze_built_structure(img)
+    structure = analyze_built_structure(img, progressive, audit)
     
+    return classify_structure_top_k(structure, blocks_info, k, original_sku)
+
+def classify_structure_top_k(structure: dict, blocks_info: dict, k: int = 3,
+                             original_sku: str = "") -> List[Tuple[str, float]]:
+    """Generuje nazwy z gotowego opisu struktury i tabelki (bez dostępu do obrazu)."""
     # 3. Generuj UNIKALNĄ nazwę
     primary = generate_unique_name_from_structure(structure, blocks_info, original_sku)
     
@@ -655,6 +798,197 @@ def build_new_name_pl(name: str, pcs: Optional[int]) -> str:
     return name
 
 
+# Pobieranie obrazów: adaptacyjna współbieżność (AIMD) z kolejką ponowień
+FETCH_TIMEOUT = 15
+FETCH_MAX_ATTEMPTS = 4
+FETCH_MAX_RETRY_AFTER = 60.0
+FETCH_ERROR_WINDOW = 20
+FETCH_MAX_ERROR_RATE = 0.1
+FETCH_BATCH = 32
+FETCH_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+THROTTLE_STATUSES = {429, 503}
+
+
+class FetchController:
+    """Adaptacyjny limit równoległych pobrań (AIMD).
+    
+    Limit rośnie addytywnie (o 1 na każde ``limit`` udanych pobrań), dopóki
+    opóźnienie mieści się w ``target_latency``, a odsetek błędów wśród
+    ostatnich ``FETCH_ERROR_WINDOW`` żądań nie przekracza ``max_error_rate``.
+    Przy 429/503 lub przekroczeniu czasu limit spada o połowę (raz na epizod
+    przeciążenia - liczą się tylko żądania wysłane po ostatnim zmniejszeniu), a kolejne żądania czekają ``Retry-After`` lub ``backoff``
+    sekund. Ponowienia pojedynczego URL-a czekają wykładniczo dłużej
+    (``retry_delay``).
+    """
+    
+    def __init__(self, start: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 target_latency: float = 3.0, backoff: float = 1.0,
+                 max_error_rate: float = FETCH_MAX_ERROR_RATE):
+        self.limit = float(start)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_error_rate = max_error_rate
+        self.recent_errors = deque(maxlen=FETCH_ERROR_WINDOW)
+        self.in_flight = 0
+        self.not_before = 0.0
+        self.last_decrease = float('-inf')
+        self.stats = {'ok': 0, 'throttled': 0, 'timeouts': 0, 'errors': 0, 'retries': 0}
+        self.cond = threading.Condition()
+    
+    def acquire(self):
+        """Czeka na wolne miejsce w limicie i koniec ewentualnej przerwy."""
+        with self.cond:
+            while True:
+                delay = self.not_before - time.monotonic()
+                if delay <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self.cond.wait(timeout=delay if delay > 0 else None)
+    
+    def release(self, outcome: str, latency: float, retry_after: Optional[float] = None):
+        """Zwalnia miejsce i dostosowuje limit do wyniku żądania."""
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            # Błąd trwały (np. 404) nie świadczy o przeciążeniu serwera
+            self.recent_errors.append(outcome not in ('ok', 'failed'))
+            if outcome == 'ok':
+                self.stats['ok'] += 1
+                if latency <= self.target_latency and self._error_rate() <= self.max_error_rate:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            elif outcome in ('throttled', 'timeout'):
+                self.stats['throttled' if outcome == 'throttled' else 'timeouts'] += 1
+                # Jedno zmniejszenie na epizod: tylko żądania wysłane po ostatnim zmniejszeniu
+                if now - latency > self.last_decrease:
+                    self.limit = max(float(self.min_limit), self.limit / 2)
+                    self.last_decrease = now
+                delay = retry_after if retry_after is not None else self.backoff
+                self.not_before = max(self.not_before, now + min(delay, FETCH_MAX_RETRY_AFTER))
+            else:
+                self.stats['errors'] += 1
+            self.cond.notify_all()
+    
+    def _error_rate(self) -> float:
+        if not self.recent_errors:
+            return 0.0
+        return sum(self.recent_errors) / len(self.recent_errors)
+    
+    def retry_delay(self, attempt: int) -> float:
+        """Opóźnienie ponowienia po nieudanej próbie nr ``attempt`` (1, 2, ...)."""
+        return min(self.backoff * 2 ** (attempt - 1), FETCH_MAX_RETRY_AFTER)
+    
+    def count_retry(self):
+        """Zlicza żądanie odłożone do kolejki ponowień."""
+        with self.cond:
+            self.stats['retries'] += 1
+    
+    def metrics(self) -> dict:
+        """Bieżący limit współbieżności i liczniki wyników."""
+        with self.cond:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight,
+                    'error_rate': self._error_rate(), **self.stats}
+
+
+# Globalny kontroler pobrań i obrazy pobrane z wyprzedzeniem (URL -> bajty)
+fetch_controller = FetchController()
+prefetched_images = {}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parsuje nagłówek Retry-After (sekundy lub data HTTP) na liczbę sekund."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def fetch_url(controller: FetchController, url: str) -> Tuple[str, Optional[bytes], str]:
+    """Jedno żądanie pod kontrolą limitu; zwraca (wynik, treść, opis błędu).
+    
+    Wynik: ``ok``, ``throttled`` (429/503), ``timeout``, ``retry`` (błąd
+    połączenia lub 5xx - do ponowienia) albo ``failed`` (bez ponawiania).
+    """
+    controller.acquire()
+    start = time.monotonic()
+    retry_after = None
+    content = None
+    # Każdy inny wyjątek to trwały błąd; miejsce w limicie jest zwalniane zawsze
+    outcome, detail = 'failed', "przerwane"
+    try:
+        resp = requests.get(url, timeout=FETCH_TIMEOUT, headers=FETCH_HEADERS)
+        detail = f"HTTP {resp.status_code}"
+        if resp.status_code in THROTTLE_STATUSES:
+            outcome = 'throttled'
+            retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+        elif resp.ok:
+            outcome, content = 'ok', resp.content
+        elif resp.status_code >= 500:
+            outcome = 'retry'
+    except requests.Timeout as e:
+        outcome, detail = 'timeout', str(e)
+    except requests.ConnectionError as e:
+        outcome, detail = 'retry', str(e)
+    except Exception as e:
+        outcome, detail = 'failed', str(e)
+    finally:
+        controller.release(outcome, time.monotonic() - start, retry_after)
+    return outcome, content, detail
+
+
+def fetch_images(urls: List[str], controller: Optional[FetchController] = None) -> dict:
+    """Pobiera równolegle obrazy z URL-i (URL -> bajty lub None przy błędzie).
+    
+    Równoległość wyznacza ``controller`` (domyślnie globalny); żądania
+    dławione, przeterminowane lub z błędem serwera wracają do kolejki
+    ponowień z opóźnieniem ``controller.retry_delay``, maksymalnie
+    ``FETCH_MAX_ATTEMPTS`` prób na URL.
+    """
+    controller = controller or fetch_controller
+    # Kolejka: (URL, numer próby, najwcześniejszy czas wysłania)
+    queue = deque((url, 1, 0.0) for url in dict.fromkeys(urls))
+    results = {}
+    
+    with ThreadPoolExecutor(max_workers=controller.max_limit) as pool:
+        running = {}
+        while queue or running:
+            now = time.monotonic()
+            for _ in range(len(queue)):
+                if len(running) >= controller.max_limit:
+                    break
+                url, attempt, ready_at = queue.popleft()
+                if ready_at > now:
+                    queue.append((url, attempt, ready_at))
+                    continue
+                running[pool.submit(fetch_url, controller, url)] = (url, attempt)
+            
+            next_ready = min((ready_at for _, _, ready_at in queue), default=None)
+            if not running:
+                time.sleep(max(0.0, next_ready - now))
+                continue
+            timeout = max(0.0, next_ready - now) if next_ready is not None else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                url, attempt = running.pop(future)
+                outcome, content, detail = future.result()
+                if outcome == 'ok':
+                    results[url] = content
+                elif outcome != 'failed' and attempt < FETCH_MAX_ATTEMPTS:
+                    controller.count_retry()
+                    queue.append((url, attempt + 1, time.monotonic() + controller.retry_delay(attempt)))
+                else:
+                    print(f"Błąd pobierania {url}: {detail}", file=sys.stderr)
+                    results[url] = None
+    
+    return results
+
+
 def fetch_image(url: str) -> Optional[Image.Image]:
     """Pobiera obraz z URL lub otwiera lokalny plik."""
     if not Image:
@@ -669,30 +1003,498 @@ def fetch_image(url: str) -> Optional[Image.Image]:
             print(f"Błąd otwierania {url}: {e}", file=sys.stderr)
             return None
     
-    # URL
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    for attempt in range(2):
+    # URL (pobrany z wyprzedzeniem albo pobierany teraz)
+    url = url.strip()
+    if url in prefetched_images:
+        content = prefetched_images[url]
+    else:
+        content = fetch_images([url]).get(url)
+    if content is None:
+        return None
+    try:
+        return Image.open(io.BytesIO(content))
+    except Exception as e:
+        print(f"Błąd dekodowania {url}: {e}", file=sys.stderr)
+        return None
+
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(output_path: str) -> str:
+    """Ścieżka manifestu trybu przyrostowego - obok pliku wynikowego."""
+    base = os.path.splitext(output_path)[0]
+    return f"{base}_manifest.json"
+
+
+def load_manifest(path: str) -> dict:
+    """Wczytuje manifest poprzedniego przebiegu (pusty, jeśli brak lub nieaktualny)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Błąd odczytu manifestu {path}: {e}", file=sys.stderr)
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(path: str, rows: dict):
+    """Zapisuje odciski wierszy i stan name_counter dla kolejnego przebiegu."""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'name_counter': name_counter,
+        'rows': rows,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+
+def row_fingerprint(original_value: str, variant_url: str, product_url: str) -> str:
+    """Odcisk danych wejściowych wiersza: Option1 value + URL-e obrazów."""
+    data = "\x1f".join((original_value, variant_url.strip(), product_url.strip()))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+# Paczka miniatur: nagłówek + rekordy stałej długości (klucz SHA-1, scena, tabelka; RGB uint8)
+PACK_MAGIC = b"AHPACK1\n"
+PACK_KEY_BYTES = 20
+PACK_SCENE_BYTES = SCENE_SIZE[0] * SCENE_SIZE[1] * 3
+PACK_TABLE_BYTES = TABLE_SIZE[0] * TABLE_SIZE[1] * 3
+PACK_RECORD_BYTES = PACK_KEY_BYTES + PACK_SCENE_BYTES + PACK_TABLE_BYTES
+
+
+def image_key(image_url: str) -> bytes:
+    """Klucz obrazu w paczce - SHA-1 źródła (URL lub ścieżka)."""
+    return hashlib.sha1(image_url.strip().encode('utf-8')).digest()
+
+
+def pack_end(size: int) -> int:
+    """Koniec ostatniego pełnego rekordu w paczce o danym rozmiarze."""
+    count = (size - len(PACK_MAGIC)) // PACK_RECORD_BYTES
+    return len(PACK_MAGIC) + count * PACK_RECORD_BYTES
+
+
+def open_pack(path: str) -> dict:
+    """Otwiera (lub tworzy) paczkę miniatur i mapuje ją w pamięci tylko do odczytu.
+    
+    Istniejący plik bez nagłówka ``PACK_MAGIC`` nie jest nadpisywany - zgłaszany
+    jest ``ValueError``.
+    """
+    pack = {'path': path, 'file': None, 'mmap': None, 'index': {}, 'hits': 0, 'added': 0}
+    header = b""
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            header = f.read(len(PACK_MAGIC))
+    if header != PACK_MAGIC:
+        # Pusty plik lub niepełny nagłówek (przerwane tworzenie) można założyć od nowa
+        if not PACK_MAGIC.startswith(header):
+            raise ValueError(f"{path} nie jest paczką miniatur")
+        with open(path, 'wb') as f:
+            f.write(PACK_MAGIC)
+        return pack
+    
+    # Niepełny rekord na końcu (przerwany zapis) - obetnij do ostatniego pełnego
+    size = os.path.getsize(path)
+    count = (size - len(PACK_MAGIC)) // PACK_RECORD_BYTES
+    complete = pack_end(size)
+    if complete != size:
+        print(f"Paczka {path}: obcięto niepełny rekord ({size - complete} B)", file=sys.stderr)
+        os.truncate(path, complete)
+    if not count:
+        return pack
+    
+    f = open(path, 'rb')
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    for i in range(count):
+        offset = len(PACK_MAGIC) + i * PACK_RECORD_BYTES
+        pack['index'][mm[offset:offset + PACK_KEY_BYTES]] = offset
+    pack['file'] = f
+    pack['mmap'] = mm
+    return pack
+
+
+def close_pack(pack: dict):
+    """Zamyka mapowanie i plik paczki."""
+    if pack['mmap'] is not None:
+        pack['mmap'].close()
+        pack['file'].close()
+        pack['mmap'] = None
+        pack['file'] = None
+
+
+def pack_lookup(pack: dict, key: bytes) -> Optional[Tuple[memoryview, memoryview]]:
+    """Zwraca widoki (bez kopiowania) na scenę i tabelkę obrazu, jeśli są w paczce."""
+    offset = pack['index'].get(key)
+    if offset is None or pack['mmap'] is None:
+        return None
+    view = memoryview(pack['mmap'])
+    scene_start = offset + PACK_KEY_BYTES
+    table_start = scene_start + PACK_SCENE_BYTES
+    pack['hits'] += 1
+    return (view[scene_start:table_start],
+            view[table_start:table_start + PACK_TABLE_BYTES])
+
+
+def pack_append(pack: dict, key: bytes, img: Image.Image):
+    """Dopisuje przeskalowaną scenę i tabelkę obrazu na koniec paczki."""
+    if key in pack['index']:
+        return
+    scene = crop_scene(img).resize(SCENE_SIZE).tobytes()
+    table = crop_table(img).convert("RGB").resize(TABLE_SIZE).tobytes()
+    # Dopisuj zawsze na granicy rekordu, nadpisując ewentualny niepełny ogon
+    with open(pack['path'], 'r+b') as f:
+        f.seek(pack_end(f.seek(0, os.SEEK_END)))
+        f.write(key + scene + table)
+        f.truncate()
+    # Nowe rekordy są widoczne w mapowaniu dopiero po ponownym otwarciu paczki
+    pack['index'][key] = None
+    pack['added'] += 1
+
+
+def pixels_from_buffer(buf) -> list:
+    """Zamienia bufor RGB uint8 na listę pikseli (r, g, b)."""
+    return list(zip(buf[0::3], buf[1::3], buf[2::3]))
+
+
+def matrix_from_buffer(buf, size: Tuple[int, int]) -> list:
+    """Zamienia bufor RGB uint8 na macierz 2D pikseli dla analizy kształtów."""
+    pixels = pixels_from_buffer(buf)
+    w, h = size
+    return [pixels[y * w:(y + 1) * w] for y in range(h)]
+
+
+def analyze_packed(scene_buf, table_buf) -> Tuple[dict, dict]:
+    """Analizuje obraz z paczki miniatur - bez dekodowania, kadrowania i skalowania.
+    
+    Zwraca (surowe wyniki detektorów, bloki z tabelki). OCR tabelki wymaga
+    pełnej rozdzielczości, więc ``total_pieces`` nie jest tu wyznaczane.
+    """
+    blocks_info = parse_block_table_pixels(pixels_from_buffer(table_buf))
+    scores = score_structure(matrix_from_buffer(scene_buf, SCENE_SIZE))
+    return scores, blocks_info
+
+
+def name_for_row(row_number: int, original_value: str, image_url: str,
+                 progressive: bool = False, audit: bool = False,
+                 pack: Optional[dict] = None,
+                 previous_fallback: Optional[str] = None) -> Tuple[str, Optional[dict]]:
+    """Pobiera obraz wiersza i generuje nazwę (bez liczby PCS).
+    
+    Zwraca (nazwa, surowe wyniki detektorów lub None, gdy brak obrazu).
+    Z paczką miniatur (``pack``) obraz obecny w paczce jest analizowany
+    bezpośrednio z mapowanej pamięci, a nowo pobrany - dopisywany do paczki.
+    ``previous_fallback`` to nazwa awaryjna wiersza z poprzedniego przebiegu:
+    gdy obraz nadal jest niedostępny, jest zwracana bez zmiany ``name_counter``.
+    """
+    global name_counter
+    
+    key = image_key(image_url) if pack is not None and image_url else None
+    packed = pack_lookup(pack, key) if key is not None else None
+    img = None if packed else fetch_image(image_url)
+    scores = None
+    if packed:
+        scores, blocks_info = analyze_packed(*packed)
+    elif img:
+        if key is not None:
+            pack_append(pack, key, img)
+        blocks_info = parse_block_table(img)
+        scores = scene_scores(img, progressive, audit)
+    
+    if scores is not None:
+        names = classify_structure_top_k(structure_from_scores(scores), blocks_info,
+                                         k=1, original_sku=original_value)
+        new_name = names[0][0] if names else "Minecraft Zestaw"
+        score = names[0][1] if names else 0.0
+        source = ", z paczki" if packed else ""
+        print(f"Wiersz {row_number}: {original_value} → {new_name} (pewność: {score:.1f}{source})")
+    elif previous_fallback is not None:
+        new_name = previous_fallback
+        print(f"Wiersz {row_number}: {original_value} → {new_name} (brak obrazu, poprzednia nazwa)")
+    else:
+        # Fallback bez obrazu - unikalny na podstawie SKU
+        fallback_base = "Kreatywny Zestaw"
+        if fallback_base in name_counter:
+            name_counter[fallback_base] += 1
+            new_name = f"Kreatywny Zestaw {name_counter[fallback_base]}"
+        else:
+            name_counter[fallback_base] = 1
+            new_name = fallback_base
+        print(f"Wiersz {row_number}: {original_value} → {new_name} (brak obrazu)")
+    
+    return new_name, scores
+
+
+# Maksymalna liczba komórek (konfiguracje x obrazy) liczonych naraz w przeglądzie progów
+SWEEP_CHUNK_CELLS = 2_000_000
+
+
+def save_scores(path: str, scored_rows: list):
+    """Zapisuje surowe wyniki detektorów wierszy (JSON Lines) do przeglądu progów."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for row_number, original_value, scores in scored_rows:
+            record = {'row': row_number, 'option1': original_value, 'scores': scores}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_scores(path: str) -> list:
+    """Wczytuje surowe wyniki detektorów zapisane przez ``save_scores``."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_sweep_grid(specs: List[str]) -> dict:
+    """Parsuje siatkę progów: ``nazwa=v1,v2,...`` (klucze STRUCTURE_/NAME_THRESHOLDS)."""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in STRUCTURE_THRESHOLDS and name not in NAME_THRESHOLDS:
+            raise ValueError(f"Nieznany próg: {name}")
         try:
-            resp = requests.get(url.strip(), timeout=15, headers=headers)
-            resp.raise_for_status()
-            return Image.open(io.BytesIO(resp.content))
-        except Exception as e:
-            if attempt == 0:
-                continue
-            print(f"Błąd pobierania {url}: {e}", file=sys.stderr)
-            return None
-    return None
+            grid[name] = [float(v) for v in values.split(',') if v]
+        except ValueError:
+            raise ValueError(f"Nieprawidłowe wartości progu {name}: {values}")
+        if not grid[name]:
+            raise ValueError(f"Brak wartości progu {name} (oczekiwano {name}=v1,v2,...)")
+    return grid
+
+
+def sweep_base_names(score_matrix, configs: List[dict]):
+    """Wektorowo wyznacza nazwy bazowe dla wszystkich obrazów i konfiguracji progów.
+    
+    ``score_matrix`` ma kształt (obrazy, detektory) w kolejności
+    ``STRUCTURE_THRESHOLDS``; zwraca macierz kodów (konfiguracje, obrazy)
+    indeksujących listę nazw ``sweep_name_list()``.
+    """
+    detectors = list(STRUCTURE_THRESHOLDS)
+    names = sweep_name_list()
+    
+    def thresholds(key, defaults):
+        return np.array([config.get(key, defaults[key]) for config in configs])[:, None]
+    
+    values = {d: score_matrix[None, :, j] for j, d in enumerate(detectors)}
+    conditions, choices = [], []
+    for detector, levels, default_name in NAME_RULES:
+        detected = values[detector] > thresholds(detector, STRUCTURE_THRESHOLDS)
+        for key, name in levels:
+            conditions.append(detected & (values[detector] > thresholds(key, NAME_THRESHOLDS)))
+            choices.append(names.index(name))
+        conditions.append(detected)
+        choices.append(names.index(default_name))
+    
+    return np.select(conditions, choices, default=names.index(FALLBACK_BASE_NAME))
+
+
+def sweep_name_list() -> List[str]:
+    """Wszystkie nazwy bazowe rozważane w przeglądzie progów."""
+    names = []
+    for _, levels, default_name in NAME_RULES:
+        names.extend(name for _, name in levels)
+        names.append(default_name)
+    names.append(FALLBACK_BASE_NAME)
+    return names
+
+
+def threshold_sweep(scores_path: str, grid: dict, top: int = 5):
+    """Przegląd progów: ocenia siatkę konfiguracji na zapisanych wynikach detektorów.
+    
+    Dla każdej konfiguracji wypisuje, ile wierszy zmienia nazwę bazową
+    względem obecnych progów, oraz najczęstsze nazwy. Porównywane są nazwy
+    bazowe - bez wariantów unikalności i liczby PCS.
+    """
+    if not np:
+        print("Brak numpy - przegląd progów niedostępny.", file=sys.stderr)
+        return
+    
+    try:
+        records = load_scores(scores_path)
+    except (OSError, ValueError) as e:
+        print(f"Błąd odczytu wyników {scores_path}: {e}", file=sys.stderr)
+        return
+    if not records:
+        print("Brak zapisanych wyników detektorów.", file=sys.stderr)
+        return
+    
+    detectors = list(STRUCTURE_THRESHOLDS)
+    score_matrix = np.array([[r['scores'][d] for d in detectors] for r in records], dtype=float)
+    names = sweep_name_list()
+    
+    keys = list(grid)
+    configs = [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+    baseline = sweep_base_names(score_matrix, [{}])[0]
+    
+    # Liczenie w porcjach, żeby macierze (konfiguracje x obrazy) mieściły się w pamięci
+    chunk = max(1, SWEEP_CHUNK_CELLS // len(records))
+    changed = np.empty(len(configs), dtype=int)
+    counts = np.empty((len(configs), len(names)), dtype=int)
+    for start in range(0, len(configs), chunk):
+        codes = sweep_base_names(score_matrix, configs[start:start + chunk])
+        changed[start:start + chunk] = (codes != baseline).sum(axis=1)
+        one_hot = codes[:, :, None] == np.arange(len(names))[None, None, :]
+        counts[start:start + chunk] = one_hot.sum(axis=1)
+    
+    print(f"Przegląd progów: {len(configs)} konfiguracji × {len(records)} obrazów\n")
+    for config, n_changed, config_counts in zip(configs, changed, counts):
+        label = " ".join(f"{k}={v:g}" for k, v in config.items()) or "(obecne progi)"
+        order = np.argsort(-config_counts, kind='stable')[:top]
+        distribution = ", ".join(f"{names[i]} {config_counts[i]}" for i in order if config_counts[i])
+        print(f"{label}: zmienione {n_changed}/{len(records)} | {distribution}")
+
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.arrow', '.feather')
+
+# Kolumny potrzebne do nazewnictwa - tylko te są czytane z wejścia kolumnowego
+PROJECTED_COLUMNS = ["Option1 value", "SKU", "Variant image URL", "Product image URL"]
+
+# Kolumny kwot - Shopify zapisuje je zawsze z dwoma miejscami po przecinku (15.00)
+SHOPIFY_MONEY_COLUMNS = {"Price", "Compare-at price", "Cost per item"}
+
+
+def is_columnar(path: str) -> bool:
+    """Czy plik jest w formacie kolumnowym (Parquet/Arrow)."""
+    return os.path.splitext(path)[1].lower() in COLUMNAR_EXTENSIONS
+
+
+def read_columnar(path: str, columns: Optional[List[str]] = None):
+    """Czyta tabelę Parquet/Arrow, opcjonalnie tylko wybrane (istniejące) kolumny."""
+    if path.lower().endswith('.parquet'):
+        names = pq.read_schema(path).names
+    else:
+        with pa.memory_map(path) as source:
+            names = pa.ipc.open_file(source).schema.names
+    if columns is not None:
+        columns = [c for c in columns if c in names]
+    
+    if path.lower().endswith('.parquet'):
+        return pq.read_table(path, columns=columns)
+    return feather.read_table(path, columns=columns, memory_map=True)
 
 
-def process_csv(input_path: str, output_path: Optional[str] = None):
-    """Przetwarza CSV: pobiera obrazy, generuje nazwy, zapisuje wynik."""
+def write_columnar(table, path: str):
+    """Zapisuje tabelę jako Parquet lub Arrow (Feather v2) według rozszerzenia."""
+    if path.lower().endswith('.parquet'):
+        pq.write_table(table, path)
+    else:
+        feather.write_feather(table, path)
+
+
+def shopify_cell(value) -> str:
+    """Zamienia wartość z tabeli kolumnowej na tekst w formacie CSV Shopify."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    return str(value)
+
+
+def shopify_column(column, name: str = "") -> List[str]:
+    """Zamienia kolumnę Arrow na teksty CSV Shopify.
+    
+    Liczbowe kolumny kwot (``SHOPIFY_MONEY_COLUMNS``) mają zawsze dwa miejsca
+    po przecinku (``15.00``). W pozostałych kolumnach zmiennoprzecinkowych
+    format jest wspólny dla całej kolumny: liczby całkowite bez części
+    ułamkowej, kwoty z dwoma miejscami po przecinku (``1.50``), inne wartości
+    bez zaokrąglania. Null/NaN to pusta komórka.
+    """
+    values = column.to_pylist()
+    floating = pa.types.is_floating(column.type)
+    money = name in SHOPIFY_MONEY_COLUMNS and (floating or pa.types.is_integer(column.type))
+    if not (floating or money):
+        return [shopify_cell(v) for v in values]
+    
+    numbers = [v for v in values if v is not None and not math.isnan(v)]
+    if money:
+        fmt = lambda v: f"{v:.2f}"
+    elif all(v.is_integer() for v in numbers):
+        fmt = lambda v: str(int(v))
+    elif all(round(v, 2) == v for v in numbers):
+        fmt = lambda v: f"{v:.2f}"
+    else:
+        fmt = str
+    return ["" if v is None or math.isnan(v) else fmt(v) for v in values]
+
+
+def table_to_rows(table) -> list:
+    """Zamienia tabelę Arrow na wiersze CSV (nagłówek + wartości tekstowe)."""
+    columns = [shopify_column(table.column(i), name) for i, name in enumerate(table.column_names)]
+    rows = [list(table.column_names)]
+    rows.extend(list(values) for values in zip(*columns))
+    return rows
+
+
+def rows_to_table(rows: list):
+    """Zamienia wiersze CSV na tabelę Arrow (wszystkie kolumny tekstowe)."""
+    header = rows[0]
+    data = [row + [""] * (len(header) - len(row)) for row in rows[1:]]
+    arrays = [pa.array([row[i] for row in data], type=pa.string()) for i in range(len(header))]
+    return pa.Table.from_arrays(arrays, names=header)
+
+
+def process_csv(input_path: str, output_path: Optional[str] = None, incremental: bool = False,
+                progressive: bool = False, audit: bool = False, sidecar: bool = False,
+                pack_path: Optional[str] = None, scores_path: Optional[str] = None):
+    """Przetwarza CSV: pobiera obrazy, generuje nazwy, zapisuje wynik.
+    
+    Wejście i wyjście mogą być też w formacie Parquet/Arrow (wymaga pyarrow).
+    Z wejścia kolumnowego czytane są tylko kolumny z ``PROJECTED_COLUMNS``;
+    pełna tabela jest czytana dopiero przy zapisie. Wyjście ``.csv`` ma zawsze
+    format importu Shopify, a ``.parquet``/``.arrow``/``.feather`` to tabela
+    z podmienioną kolumną ``Option1 value``. Przy ``sidecar`` zapisywany jest
+    tylko kompaktowy plik (``.csv`` lub kolumnowy) z numerem wiersza i nową
+    wartością ``Option1 value``.
+    
+    ``pack_path`` wskazuje paczkę miniatur (mapowaną w pamięci): obrazy już
+    w niej obecne nie są pobierane ani dekodowane, nowe są do niej dopisywane.
+    
+    ``scores_path`` zapisuje surowe wyniki detektorów przetworzonych wierszy
+    (do ``threshold_sweep``); wiersze pominięte w trybie przyrostowym nie są
+    oceniane ponownie i nie trafiają do tego pliku.
+    
+    W trybie przyrostowym (``incremental``) wiersze, których odcisk zgadza się
+    z manifestem poprzedniego przebiegu, zachowują poprzednią nazwę - tylko
+    nowe lub zmienione wiersze (oraz te, które dostały nazwę awaryjną z powodu
+    braku obrazu) są pobierane i klasyfikowane. Wiersz z nazwą awaryjną, którego
+    obraz nadal jest niedostępny, zachowuje poprzednią nazwę.
+    
+    W trybie progresywnym (``progressive``) detektory z ``COARSE_DETECTORS``
+    są oceniane w niskiej rozdzielczości i eskalowane do pełnej tylko blisko
+    progów; pozostałe detektory zawsze liczą się w pełnej rozdzielczości.
+    ``audit`` dodatkowo mierzy zgodność z pełną analizą.
+    """
+    if scores_path and progressive:
+        print("--scores nie działa z trybem progresywnym: zgrubne wyniki nie są "
+              "porównywalne z pełną rozdzielczością.", file=sys.stderr)
+        return
+    
+    columnar_input = is_columnar(input_path)
     if not output_path:
-        base = os.path.splitext(input_path)[0]
-        output_path = f"{base}_renamed.csv"
+        base, ext = os.path.splitext(input_path)
+        if sidecar:
+            output_path = f"{base}_renamed_sidecar{ext if columnar_input else '.csv'}"
+        else:
+            output_path = f"{base}_renamed{ext if columnar_input else '.csv'}"
+    
+    if sidecar and not (is_columnar(output_path) or output_path.lower().endswith('.csv')):
+        print(f"Plik pomocniczy musi mieć rozszerzenie .csv lub {'/'.join(COLUMNAR_EXTENSIONS)}: "
+              f"{output_path}", file=sys.stderr)
+        return
     
-    with open(input_path, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f)
-        rows = list(reader)
+    # Wyjście kolumnowe (także kolumnowy plik pomocniczy) wymaga pyarrow
+    if not pa and (columnar_input or is_columnar(output_path)):
+        print("Brak pyarrow - obsługa Parquet/Arrow niedostępna.", file=sys.stderr)
+        return
+    
+    if columnar_input:
+        rows = table_to_rows(read_columnar(input_path, PROJECTED_COLUMNS))
+    else:
+        with open(input_path, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            rows = list(reader)
     
     if not rows:
         print("Plik CSV jest pusty.", file=sys.stderr)
@@ -710,22 +1512,68 @@ def process_csv(input_path: str, output_path: Optional[str] = None):
     image_candidates = {"Variant image URL", "Product image URL"}
     image_idx = None
     product_image_idx = None
+    sku_idx = None
     for i, col in enumerate(header):
         if col == "Variant image URL":
             image_idx = i
         elif col == "Product image URL":
             product_image_idx = i
+        elif col == "SKU":
+            sku_idx = i
     
     if image_idx is None and product_image_idx is None:
         print("Brak kolumny z URL obrazu.", file=sys.stderr)
         return
     
-    # Przetwarzaj wiersze
+    try:
+        pack = open_pack(pack_path) if pack_path else None
+    except (OSError, ValueError) as e:
+        print(f"Błąd paczki miniatur: {e}", file=sys.stderr)
+        return
+    
+    # Manifest poprzedniego przebiegu (tryb przyrostowy)
+    manifest_path = manifest_path_for(output_path)
+    previous_rows = {}
+    if incremental:
+        manifest = load_manifest(manifest_path)
+        previous_rows = manifest.get('rows', {})
+        for name, count in manifest.get('name_counter', {}).items():
+            name_counter[name] = max(name_counter.get(name, 0), count)
+    manifest_rows = {}
+    reused = 0
+    
+    scored_rows = []
+    
+    # Przetwarzaj wiersze: najpierw wybierz wiersze do przeliczenia
+    jobs = []
+    seen_keys = set()
     for i, row in enumerate(rows[1:], start=2):
         if len(row) <= max(option1_idx, image_idx or 0, product_image_idx or 0):
             continue
         
         original_value = row[option1_idx]
+        variant_url = row[image_idx] if image_idx is not None else ""
+        product_url = row[product_image_idx] if product_image_idx is not None else ""
+        
+        # Klucz wiersza: SKU (jeśli jest), inaczej numer wiersza
+        key = f"wiersz:{i}"
+        if sku_idx is not None and len(row) > sku_idx and row[sku_idx].strip():
+            key = f"sku:{row[sku_idx].strip()}"
+            if key in seen_keys:
+                key = f"{key}#{i}"
+        seen_keys.add(key)
+        fingerprint = row_fingerprint(original_value, variant_url, product_url)
+        
+        previous = previous_rows.get(key)
+        unchanged = previous is not None and previous.get('fingerprint') == fingerprint
+        # Wiersze z nazwą awaryjną (brak obrazu) są zawsze przeliczane ponownie,
+        # ale zachowują ją, jeśli obraz nadal jest niedostępny
+        if unchanged and not previous.get('fallback'):
+            row[option1_idx] = previous['value']
+            manifest_rows[key] = previous
+            reused += 1
+            continue
+        previous_fallback = previous['value'] if unchanged else None
         
         # Wybierz URL obrazu (priorytet: Variant image URL, potem Product image URL)
         image_url = ""
@@ -734,45 +1582,127 @@ def process_csv(input_path: str, output_path: Optional[str] = None):
         if not image_url and product_image_idx and len(row) > product_image_idx:
             image_url = row[product_image_idx].strip()
         
-        # Wyciągnij liczbę PCS
-        pcs = extract_piece_count(original_value)
+        jobs.append((i, row, original_value, image_url, key, fingerprint, previous_fallback))
+    
+    # Potem nazywaj je partiami; obrazy partii są pobierane równolegle z wyprzedzeniem
+    for start in range(0, len(jobs), FETCH_BATCH):
+        batch = jobs[start:start + FETCH_BATCH]
+        urls = [job[3] for job in batch
+                if job[3] and not os.path.exists(job[3])
+                and not (pack is not None and pack['index'].get(image_key(job[3])) is not None)]
+        prefetched_images.update(fetch_images(urls))
         
-        # Pobierz obraz i wygeneruj nazwę
-        img = fetch_image(image_url)
-        if img:
-            names = classify_scene_top_k(img, k=1, original_sku=original_value)
-            new_name = names[0][0] if names else "Minecraft Zestaw"
-            score = names[0][1] if names else 0.0
-            print(f"Wiersz {i}: {original_value} → {new_name} (pewność: {score:.1f})")
-        else:
-            # Fallback bez obrazu - unikalny na podstawie SKU
-            global name_counter
-            fallback_base = "Kreatywny Zestaw"
-            if fallback_base in name_counter:
-                name_counter[fallback_base] += 1
-                new_name = f"Kreatywny Zestaw {name_counter[fallback_base]}"
+        for i, row, original_value, image_url, key, fingerprint, previous_fallback in batch:
+            # Wyciągnij liczbę PCS
+            pcs = extract_piece_count(original_value)
+            
+            # Pobierz obraz i wygeneruj nazwę
+            new_name, scores = name_for_row(i, original_value, image_url, progressive, audit, pack,
+                                            previous_fallback)
+            if scores is not None:
+                scored_rows.append((i, original_value, scores))
+            
+            # Zbuduj finalną nazwę (poprzednia nazwa awaryjna ma już liczbę PCS)
+            if scores is None and previous_fallback is not None:
+                row[option1_idx] = previous_fallback
             else:
-                name_counter[fallback_base] = 1
-                new_name = fallback_base
-            print(f"Wiersz {i}: {original_value} → {new_name} (brak obrazu)")
+                row[option1_idx] = build_new_name_pl(new_name, pcs)
+            manifest_rows[key] = {'fingerprint': fingerprint, 'value': row[option1_idx]}
+            if scores is None:
+                manifest_rows[key]['fallback'] = True
         
-        # Zbuduj finalną nazwę
-        row[option1_idx] = build_new_name_pl(new_name, pcs)
+        prefetched_images.clear()
+    
+    metrics = fetch_controller.metrics()
+    if metrics['ok'] or metrics['errors'] or metrics['throttled'] or metrics['timeouts']:
+        print(f"\nPobieranie: limit współbieżności {metrics['limit']}, pobrane {metrics['ok']}, "
+              f"dławienie {metrics['throttled']}, przekroczenia czasu {metrics['timeouts']}, "
+              f"błędy {metrics['errors']}, ponowienia {metrics['retries']}")
+    
+    if pack is not None:
+        close_pack(pack)
+        print(f"\nPaczka miniatur: z paczki {pack['hits']}, dopisane {pack['added']}")
     
     # Zapisz
-    with open(output_path, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerows(rows)
+    if sidecar:
+        new_values = [row[option1_idx] if len(row) > option1_idx else "" for row in rows[1:]]
+        if is_columnar(output_path):
+            table = pa.table({
+                'row': pa.array(range(2, len(rows) + 1), type=pa.int32()),
+                'Option1 value': pa.array(new_values, type=pa.string()),
+            })
+            write_columnar(table, output_path)
+        else:
+            with open(output_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["row", "Option1 value"])
+                writer.writerows(zip(range(2, len(rows) + 1), new_values))
+    elif columnar_input:
+        new_values = pa.array([row[option1_idx] for row in rows[1:]], type=pa.string())
+        full_table = read_columnar(input_path)
+        if is_columnar(output_path):
+            column_idx = full_table.column_names.index("Option1 value")
+            write_columnar(full_table.set_column(column_idx, "Option1 value", new_values), output_path)
+        else:
+            full_rows = table_to_rows(full_table)
+            column_idx = full_rows[0].index("Option1 value")
+            for full_row, value in zip(full_rows[1:], new_values.to_pylist()):
+                full_row[column_idx] = value
+            with open(output_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerows(full_rows)
+    elif is_columnar(output_path):
+        write_columnar(rows_to_table(rows), output_path)
+    else:
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerows(rows)
+    
+    if scores_path:
+        save_scores(scores_path, scored_rows)
+    
+    if progressive:
+        print_progressive_report()
+    
+    if incremental:
+        save_manifest(manifest_path, manifest_rows)
+        print(f"\nBez zmian (pominięte): {reused}, przetworzone: {len(manifest_rows) - reused}")
     
     print(f"\n✅ Zapisano: {output_path}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Użycie: python3 rename_variants.py <input.csv> [output.csv]")
-        sys.exit(1)
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    flags = {a for a in sys.argv[1:] if a.startswith('--') and '=' not in a}
+    options = dict(a[2:].split('=', 1) for a in sys.argv[1:] if a.startswith('--') and '=' in a)
     
-    input_csv = sys.argv[1]
-    output_csv = sys.argv[2] if len(sys.argv) > 2 else None
+    if 'sweep' in options:
+        try:
+            grid = parse_sweep_grid(args)
+        except ValueError as e:
+            print(f"{e}", file=sys.stderr)
+            print("Użycie: python3 rename_variants.py --sweep=<plik.jsonl> <próg>=<v1,v2,...> ...\n"
+                  f"Dostępne progi: {', '.join(list(STRUCTURE_THRESHOLDS) + list(NAME_THRESHOLDS))}",
+                  file=sys.stderr)
+            sys.exit(1)
+        threshold_sweep(options['sweep'], grid)
+        sys.exit(0)
+    
+    if not args:
+        print("Użycie: python3 rename_variants.py <input.csv|.parquet|.arrow> [output] "
+              "[--incremental] [--progressive] [--progressive-audit] [--sidecar] "
+              "[--pack=<plik>] [--scores=<plik.jsonl>]")
+        print("        python3 rename_variants.py --sweep=<plik.jsonl> <próg>=<v1,v2,...> ...")
+        sys.exit(1)
     
-    process_csv(input_csv, output_csv)
+    input_csv = args[0]
+    output_csv = args[1] if len(args) > 1 else None
+    audit = '--progressive-audit' in flags
+    
+    process_csv(input_csv, output_csv,
+                incremental='--incremental' in flags,
+                progressive='--progressive' in flags or audit,
+                audit=audit,
+                sidecar='--sidecar' in flags,
+                pack_path=options.get('pack'),
+                scores_path=options.get('scores'))
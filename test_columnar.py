@@ -0,0 +1,38 @@
+import csv
+
+import pytest
+
+import rename_variants as rv
+
+
+def test_csv_input_gets_csv_sidecar_by_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(rv, 'fetch_images', lambda urls, controller=None: {url: None for url in urls})
+    monkeypatch.setattr(rv, 'name_counter', {})
+    input_path = tmp_path / "in.csv"
+    with open(input_path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([
+            ["Option1 value", "SKU", "Variant image URL"],
+            ["RM-1 250 PCS", "A1", "http://example.invalid/a.jpg"],
+        ])
+
+    rv.process_csv(str(input_path), sidecar=True)
+
+    with open(tmp_path / "in_renamed_sidecar.csv", 'r', encoding='utf-8') as f:
+        assert list(csv.reader(f)) == [["row", "Option1 value"], ["2", "Kreatywny Zestaw 250PCS"]]
+
+
+def test_money_columns_keep_two_decimals():
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({
+        'Price': pa.array([15.0, None, 20.0], type=pa.float64()),
+        'Cost per item': pa.array([3, 4, None], type=pa.int64()),
+        'Weight value (grams)': pa.array([150.0, 200.0, float('nan')], type=pa.float64()),
+        'Unit price total measure': pa.array([1.5, 2.0, 0.25], type=pa.float64()),
+    })
+
+    assert rv.table_to_rows(table) == [
+        ['Price', 'Cost per item', 'Weight value (grams)', 'Unit price total measure'],
+        ['15.00', '3.00', '150', '1.50'],
+        ['', '4.00', '200', '2.00'],
+        ['20.00', '', '', '0.25'],
+    ]
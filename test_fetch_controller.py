@@ -0,0 +1,169 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import rename_variants as rv
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Fałszywy CDN: 429 powyżej 2 równoległych żądań, co 7. żądanie 503."""
+    lock = threading.Lock()
+    active = 0
+    count = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.count += 1
+            overloaded = cls.active > 2
+            unavailable = cls.count % 7 == 0
+        time.sleep(0.02)
+        # Zwolnij miejsce przed odpowiedzią - klient wyśle następne żądanie dopiero po niej
+        with cls.lock:
+            cls.active -= 1
+        if overloaded or unavailable:
+            self.send_response(429 if overloaded else 503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        body = self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_fetch_images_survives_throttling(server):
+    controller = rv.FetchController(start=4, max_limit=8, backoff=0.01)
+    urls = [f"{server}/img{i}.jpg" for i in range(40)]
+
+    results = rv.fetch_images(urls, controller)
+
+    assert all(results[url] == f"/img{i}.jpg".encode('utf-8') for i, url in enumerate(urls))
+    metrics = controller.metrics()
+    assert metrics['throttled'] > 0
+    assert metrics['retries'] >= metrics['throttled']
+    assert controller.min_limit <= metrics['limit'] < 4
+    assert metrics['in_flight'] == 0
+
+
+def test_throttling_halves_limit_once_per_episode():
+    controller = rv.FetchController(start=8, backoff=0.0)
+    controller.acquire()
+    controller.release('throttled', 0.0)
+    assert controller.limit == 4.0
+
+    # Żądanie wysłane przed ostatnim zmniejszeniem należy do tego samego epizodu
+    controller.acquire()
+    controller.release('throttled', 10.0)
+    assert controller.limit == 4.0
+    controller.acquire()
+    controller.release('timeout', 10.0)
+    assert controller.limit == 4.0
+
+    # Żądanie wysłane po zmniejszeniu to nowy epizod
+    controller.last_decrease = time.monotonic() - 1.0
+    controller.acquire()
+    controller.release('timeout', 0.5)
+    assert controller.limit == 2.0
+
+    controller.last_decrease = float('-inf')
+    for _ in range(4):
+        controller.acquire()
+        controller.release('throttled', 0.0)
+        controller.last_decrease = float('-inf')
+    assert controller.limit == controller.min_limit
+    metrics = controller.metrics()
+    assert (metrics['throttled'], metrics['timeouts'], metrics['in_flight']) == (6, 2, 0)
+
+
+def test_healthy_responses_grow_limit_additively():
+    controller = rv.FetchController(start=4, max_limit=5, target_latency=1.0)
+    controller.acquire()
+    controller.release('ok', 0.1)
+    assert controller.limit == 4.25
+
+    # Wolna odpowiedź nie zwiększa limitu
+    controller.acquire()
+    controller.release('ok', 2.0)
+    assert controller.limit == 4.25
+
+    for _ in range(10):
+        controller.acquire()
+        controller.release('ok', 0.1)
+    assert controller.limit == 5.0
+
+
+def test_error_rate_pauses_growth():
+    controller = rv.FetchController(start=4, max_error_rate=0.1)
+    controller.acquire()
+    controller.release('retry', 0.1)
+    for _ in range(5):
+        controller.acquire()
+        controller.release('ok', 0.1)
+    # 1 błąd na 6 żądań > 10%
+    assert controller.limit == 4.0
+
+    # Trwałe błędy (np. 404) nie liczą się do odsetka błędów
+    controller = rv.FetchController(start=4, max_error_rate=0.1)
+    controller.acquire()
+    controller.release('failed', 0.1)
+    controller.acquire()
+    controller.release('ok', 0.1)
+    assert controller.limit == 4.25
+
+
+def test_retry_after_delays_acquire():
+    controller = rv.FetchController(start=4, backoff=0.0)
+    controller.acquire()
+    before = time.monotonic()
+    controller.release('throttled', 0.0, retry_after=0.2)
+    assert controller.not_before >= before + 0.2
+
+    controller.acquire()
+    assert time.monotonic() - before >= 0.2
+    controller.release('ok', 0.0)
+
+    # Bardzo długie Retry-After jest przycinane
+    controller.acquire()
+    now = time.monotonic()
+    controller.release('throttled', 0.0, retry_after=3600.0)
+    assert controller.not_before <= now + rv.FETCH_MAX_RETRY_AFTER + 1.0
+
+
+def test_parse_retry_after():
+    assert rv.parse_retry_after('3') == 3.0
+    assert rv.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+    assert rv.parse_retry_after('') is None
+    assert rv.parse_retry_after('soon') is None
+
+
+def test_fetch_url_releases_slot_on_unexpected_error(monkeypatch):
+    def broken_get(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(rv.requests, 'get', broken_get)
+    controller = rv.FetchController(start=1, max_limit=1)
+
+    for _ in range(3):
+        outcome, content, detail = rv.fetch_url(controller, "http://example.invalid/a.jpg")
+        assert (outcome, content, detail) == ('failed', None, "boom")
+
+    metrics = controller.metrics()
+    assert metrics['in_flight'] == 0
+    assert metrics['errors'] == 3
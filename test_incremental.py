@@ -0,0 +1,37 @@
+import csv
+
+import rename_variants as rv
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def read_names(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [row[0] for row in list(csv.reader(f))[1:]]
+
+
+def test_fallback_rows_keep_names_across_incremental_runs(tmp_path, monkeypatch):
+    # Pobieranie zawsze zawodzi - każdy wiersz dostaje nazwę awaryjną
+    monkeypatch.setattr(rv, 'fetch_images', lambda urls, controller=None: {url: None for url in urls})
+    input_path = tmp_path / "in.csv"
+    output_path = tmp_path / "out.csv"
+    write_csv(input_path, [
+        ["Option1 value", "SKU", "Variant image URL"],
+        ["RM-1 250 PCS", "A1", "http://example.invalid/a.jpg"],
+        ["RM-2 100 PCS", "A2", "http://example.invalid/b.jpg"],
+        ["RM-3", "A3", ""],
+    ])
+
+    runs = []
+    for _ in range(3):
+        # Każdy przebieg to osobny proces: licznik nazw pochodzi tylko z manifestu
+        monkeypatch.setattr(rv, 'name_counter', {})
+        rv.process_csv(str(input_path), str(output_path), incremental=True)
+        runs.append(read_names(output_path))
+
+    assert runs[0] == ["Kreatywny Zestaw 250PCS", "Kreatywny Zestaw 2 100PCS", "Kreatywny Zestaw 3"]
+    assert runs[1] == runs[0]
+    assert runs[2] == runs[0]
@@ -0,0 +1,21 @@
+import pytest
+
+import rename_variants as rv
+
+
+def test_open_pack_refuses_foreign_files(tmp_path):
+    for content in (b"hello", b"not a thumbnail pack at all"):
+        path = tmp_path / "other.bin"
+        path.write_bytes(content)
+        with pytest.raises(ValueError):
+            rv.open_pack(str(path))
+        assert path.read_bytes() == content
+
+
+def test_open_pack_creates_empty_or_partial_header(tmp_path):
+    for content in (b"", rv.PACK_MAGIC[:4]):
+        path = tmp_path / "thumbs.ahpack"
+        path.write_bytes(content)
+        pack = rv.open_pack(str(path))
+        rv.close_pack(pack)
+        assert path.read_bytes() == rv.PACK_MAGIC